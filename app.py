@@ -1,30 +1,42 @@
+import os
+
+# Run LangChain callbacks on a background thread instead of blocking the agent
+# loop between steps. Must be set before any langchain module is imported.
+os.environ.setdefault("LANGCHAIN_CALLBACKS_BACKGROUND", "true")
+
 import streamlit as st
 from pathlib import Path
-from langchain.agents import create_sql_agent
-from langchain.sql_database import SQLDatabase
-from langchain.agents.agent_types import AgentType
-from langchain.callbacks import StreamlitCallbackHandler
-from langchain.agents.agent_toolkits import SQLDatabaseToolkit
-from sqlalchemy import create_engine
+from types import SimpleNamespace
 import sqlite3
-from langchain_groq import ChatGroq
-import pandas as pd
 from dotenv import load_dotenv
-import os
-import time  # Import for loading indicator
+import hashlib
+import json
+import logging
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Keep LangChain quiet unless explicitly debugging; the StreamlitCallbackHandler
+# already gives users a visible trace, and stdout prints go through a captured
+# stream under Streamlit Cloud, costing time on long traces.
+DEBUG = os.getenv("DEBUG") == "1"
+logging.getLogger("langchain").setLevel(logging.DEBUG if DEBUG else logging.WARNING)
+
 # Get Groq API key from environment variable
 api_key = os.getenv("GROQ_API_KEY")
 
 # Setting up the page configuration with title and icon
 st.set_page_config(page_title="LangChain: Chat with SQL DB", page_icon="🦜",layout="centered")
 
+# UI theming lives behind a single switch so one module serves both the themed
+# and plain deployments instead of shipping two near-identical app copies (and
+# paying the langchain import + ChatGroq construction cost twice).
+THEME = os.getenv("APP_THEME", "space")
+
 # Adding custom CSS and HTML for UI enhancement
-st.markdown(
-    """
+if THEME != "plain":
+    st.markdown(
+        """
     <style>
     /* Background image for the entire app */
     .stApp {
@@ -93,6 +105,12 @@ st.markdown(
         color: white;
     }
 
+    /* Result tables: styled client-side instead of via pandas Styler */
+    div[data-testid='stDataFrame'] {
+        color: white;
+        background-color: black;
+    }
+
     /* Loading spinner */
     .spinner {
         border: 4px solid rgba(255, 255, 255, 0.1);
@@ -110,56 +128,260 @@ st.markdown(
     }
 
     </style>
-    """, 
-    unsafe_allow_html=True
-)
+    """,
+        unsafe_allow_html=True
+    )
 
-# Add HTML for the heading, tagline, and logo with background image
-st.markdown(
-    """
+    # Add HTML for the heading, tagline, and logo with background image
+    st.markdown(
+        """
     <div class="container header-container">
         <img src="https://th.bing.com/th/id/OIP.Q6FO3FA_rXGiJkF6k6615wAAAA?rs=1&pid=ImgDetMain" alt="Logo" class="logo">
         <h1 class="main-title">LangChain SQL Chatbot</h1>
         <p class="tagline">Empowering your data with AI-driven conversations</p>
     </div>
     """,
-    unsafe_allow_html=True
-)
+        unsafe_allow_html=True
+    )
+else:
+    st.title("LangChain SQL Chatbot")
 
 # Info messages if API key is not provided
 if not api_key:
     st.error("GROQ_API_KEY not found in .env file")
 
-# Initialize the Groq LLM
-llm = ChatGroq(groq_api_key=api_key, model_name="gemma2-9b-it", streaming=True)
+# Heavyweight imports (the langchain graph, sqlalchemy) are deferred behind a
+# cached loader: cold start is dominated by importing langchain, and doing it
+# here lets the page paint first. Reruns get the populated namespace for free.
+@st.cache_resource
+def get_deps():
+    from langchain.agents import create_sql_agent
+    from langchain.sql_database import SQLDatabase
+    from langchain.agents.agent_types import AgentType
+    from langchain.callbacks import StreamlitCallbackHandler
+    from langchain.agents.agent_toolkits import SQLDatabaseToolkit
+    from langchain.agents.agent_toolkits.sql.prompt import SQL_PREFIX
+    from langchain_groq import ChatGroq
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import QueuePool
+
+    return SimpleNamespace(
+        create_sql_agent=create_sql_agent,
+        SQLDatabase=SQLDatabase,
+        AgentType=AgentType,
+        StreamlitCallbackHandler=StreamlitCallbackHandler,
+        SQLDatabaseToolkit=SQLDatabaseToolkit,
+        SQL_PREFIX=SQL_PREFIX,
+        ChatGroq=ChatGroq,
+        create_engine=create_engine,
+        QueuePool=QueuePool,
+    )
+
 
-# Function to configure SQLite database
+# Groq model selection: default to the fastest 8B path and escalate to the
+# 70B model only when the small model's answer fails the post-check below.
+PRIMARY_MODEL = "llama-3.1-8b-instant"
+FALLBACK_MODEL = "llama-3.3-70b-versatile"
+
+
+@st.cache_resource
+def get_llm(model_name):
+    deps = get_deps()
+    return deps.ChatGroq(groq_api_key=api_key, model_name=model_name, streaming=True)
+
+
+
+
+# Exact-match prompt cache: identical (prompt, llm) pairs recur both within a
+# ReAct loop and across sessions, and each hit skips a Groq round-trip.
+@st.cache_resource
+def init_llm_cache():
+    import langchain
+    from langchain_community.cache import SQLiteCache
+
+    langchain.llm_cache = SQLiteCache(database_path=".langchain_cache.db")
+    return langchain.llm_cache
+
+
+init_llm_cache()
+
+# Function to configure SQLite database. st.cache_resource keeps one engine
+# and pool per process, shared across reruns and sessions; a module global
+# would not survive Streamlit re-execing the script into a fresh namespace on
+# every interaction.
 @st.cache_resource(ttl="2h")
 def configure_db():
+    deps = get_deps()
     dbfilepath = (Path(__file__).parent / "analytics_db").absolute()
-    creator = lambda: sqlite3.connect(f"file:{dbfilepath}?mode=ro", uri=True)
-    return SQLDatabase(create_engine("sqlite:///", creator=creator))
+
+    # WAL and synchronous are persistent file-level settings, but they can't be
+    # changed through a mode=ro connection, so apply them once via a read-write
+    # connection before the pool opens its read-only ones.
+    setup_conn = sqlite3.connect(dbfilepath)
+    setup_conn.execute("PRAGMA journal_mode=WAL")
+    setup_conn.execute("PRAGMA synchronous=NORMAL")
+    setup_conn.close()
+
+    # Per-connection pragmas: big page cache + memory temp store + mmap keep
+    # the agent's repeated SELECTs in warm memory instead of hitting disk.
+    def creator():
+        # QueuePool hands connections across threads and Streamlit runs each
+        # script run on a different thread, so the default same-thread check
+        # would raise ProgrammingError on the first reuse
+        conn = sqlite3.connect(
+            f"file:{dbfilepath}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.execute("PRAGMA cache_size=-131072")  # 128 MB
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    # A small QueuePool of independent read-only connections lets concurrent
+    # tool calls (and concurrent users) run in parallel instead of serializing
+    # on the default single-connection SQLite pool.
+    engine = deps.create_engine(
+        "sqlite:///",
+        creator=creator,
+        poolclass=deps.QueuePool,
+        pool_size=8,
+        max_overflow=4,
+        pool_pre_ping=False,
+    )
+    return deps.SQLDatabase(engine)
 
 # Configure DB
 db = configure_db()
 
-# SQL toolkit
-toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+# Introspect the schema once per process, cached the same way as the DB
+# handle. The analytics DB is immutable, so baking the table info straight
+# into the agent prompt saves the list_tables and schema tool calls (each an
+# LLM round-trip) at the start of every query — and the PRAGMA walk behind
+# get_table_info does not repeat on every script rerun.
+@st.cache_resource(ttl="2h")
+def get_schema(_db):
+    return _db.get_table_info()
+
+
+schema_str = get_schema(db)
+
+# Semantic response cache: paraphrased repeats of earlier questions ("top 5
+# customers" vs "show me the top 5 customers") skip the whole agent loop and
+# return the stored answer instead of firing new Groq calls.
+SEMANTIC_CACHE_DIR = Path.home() / ".sql_chat_cache"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+
+class SemanticCache:
+    """FAISS-backed cache mapping query embeddings to agent answers.
+
+    Keyed on a hash of the DB schema so answers are invalidated if the
+    underlying database changes. Persisted under SEMANTIC_CACHE_DIR.
+    """
+
+    def __init__(self, cache_dir, schema_hash, dim=384):
+        import faiss
+
+        self._faiss = faiss
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = cache_dir / f"{schema_hash}.index"
+        self._answers_path = cache_dir / f"{schema_hash}.json"
+        if self._index_path.exists() and self._answers_path.exists():
+            self.index = faiss.read_index(str(self._index_path))
+            self.answers = json.loads(self._answers_path.read_text())
+        else:
+            # Inner product over normalized embeddings == cosine similarity
+            self.index = faiss.IndexFlatIP(dim)
+            self.answers = []
+
+    def lookup(self, embedding):
+        if self.index.ntotal == 0:
+            return None
+        scores, ids = self.index.search(embedding, 1)
+        if scores[0][0] >= SEMANTIC_CACHE_THRESHOLD:
+            return self.answers[ids[0][0]]
+        return None
+
+    def add(self, embedding, answer):
+        self.index.add(embedding)
+        self.answers.append(answer)
+        self._faiss.write_index(self.index, str(self._index_path))
+        self._answers_path.write_text(json.dumps(self.answers))
+
+
+@st.cache_resource
+def get_query_embedder():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer("all-MiniLM-L6-v2")
 
-# Creating an agent with SQL DB and Groq LLM
-agent = create_sql_agent(
-    llm=llm,
-    toolkit=toolkit,
-    verbose=True,
-    agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION
-)
+
+@st.cache_resource
+def get_semantic_cache(schema_hash):
+    return SemanticCache(SEMANTIC_CACHE_DIR, schema_hash)
+
+
+def embed_query(text):
+    import numpy as np
+
+    vec = get_query_embedder().encode([text], normalize_embeddings=True)
+    return np.asarray(vec, dtype="float32")
+
+
+schema_hash = hashlib.sha256(schema_str.encode()).hexdigest()[:16]
+semantic_cache = get_semantic_cache(schema_hash)
+
+# Creating an agent with SQL DB and Groq LLM. Cached so the toolkit, prompt
+# templates and executor are built once per (model, schema) instead of on
+# every script rerun; the leading underscore makes Streamlit skip hashing the
+# unhashable SQLDatabase.
+@st.cache_resource
+def build_sql_agent(model_name, _db, schema, early_stopping):
+    deps = get_deps()
+    llm_obj = get_llm(model_name)
+    toolkit = deps.SQLDatabaseToolkit(db=_db, llm=llm_obj)
+    return deps.create_sql_agent(
+        llm=llm_obj,
+        toolkit=toolkit,
+        verbose=DEBUG,
+        agent_type=deps.AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        prefix=deps.SQL_PREFIX + "\n\nSchema:\n" + schema,
+        agent_executor_kwargs={
+            # Cap runaway loops: with the default 15 iterations a miswritten
+            # query can burn 15 Groq calls before giving up
+            "max_iterations": 6,
+            "max_execution_time": 20,
+            "early_stopping_method": early_stopping,
+            "handle_parsing_errors": True,
+        },
+    )
+
+
+# The primary agent stops with "force" so a capped run returns the canned
+# "Agent stopped" sentinel the escalation check below keys on; the 70B
+# fallback uses "generate" to squeeze a best-effort answer out of whatever
+# it managed to observe.
+agent = build_sql_agent(PRIMARY_MODEL, db, schema_str, "force")
 
 # Session state for messages (clear button available)
 if "messages" not in st.session_state:
     st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
 
-# Display chat history messages
-for msg in st.session_state.messages:
+# Display chat history messages. Each chat bubble is its own delta to the
+# browser on every rerun, so long sessions only render the recent tail until
+# the user explicitly asks for the rest. A button (not an expander — expander
+# children are executed and shipped even while collapsed) means the old
+# messages are truly skipped on normal reruns.
+HISTORY_TAIL = 20
+
+messages = st.session_state.messages
+if len(messages) > HISTORY_TAIL and not st.session_state.get("show_full_history"):
+    if st.button(f"Show {len(messages) - HISTORY_TAIL} earlier messages"):
+        st.session_state["show_full_history"] = True
+    else:
+        messages = messages[-HISTORY_TAIL:]
+for msg in messages:
     st.chat_message(msg["role"]).write(msg["content"])
 
 # Input for user query
@@ -172,30 +394,49 @@ if user_query:
 
     # Display loading spinner while processing
     with st.spinner("Processing your query..."):
-        time.sleep(1)  # Optional: Add a small delay for UX
         with st.chat_message("assistant"):
-            streamlit_callback = StreamlitCallbackHandler(st.container())
+            streamlit_callback = get_deps().StreamlitCallbackHandler(st.container())
             try:
-                response = agent.run(user_query, callbacks=[streamlit_callback])
+                # Check the semantic cache first; only run the agent on a miss
+                query_embedding = embed_query(user_query)
+                response = semantic_cache.lookup(query_embedding)
+                if response is None:
+                    # Stream the agent instead of blocking on agent.run so
+                    # final-answer tokens render as they arrive; time to first
+                    # token drops from whole-response latency to one LLM step.
+                    placeholder = st.empty()
+                    response = ""
+                    # max_concurrency lets independent runnables inside the
+                    # executor fan out across the pooled read connections
+                    for chunk in agent.stream(
+                        {"input": user_query},
+                        config={
+                            "callbacks": [streamlit_callback],
+                            "max_concurrency": 4,
+                        },
+                    ):
+                        if "output" in chunk:
+                            response += chunk["output"]
+                            placeholder.markdown(response)
+                    if not response or "Agent stopped" in response:
+                        # The small model failed to produce an answer; retry
+                        # once on the larger model before giving up
+                        response = build_sql_agent(
+                            FALLBACK_MODEL, db, schema_str, "generate"
+                        ).run(user_query, callbacks=[streamlit_callback])
+                        placeholder.markdown(response)
+                    # Only persist answers that passed the success check; a
+                    # failed fallback cached here would be served to every
+                    # future paraphrase with no invalidation path
+                    if response and "Agent stopped" not in response:
+                        semantic_cache.add(query_embedding, response)
+                else:
+                    # Cache hit: the full answer is already known
+                    st.write(response)
+                # Every path above yields a plain string (streamed chunks,
+                # cached answers and the fallback run), so no per-row type
+                # sniffing of the response is needed before recording it.
                 st.session_state.messages.append({"role": "assistant", "content": response})
 
-                # Handle both final answers and actions
-                if isinstance(response, str):
-                    # Directly handle string responses
-                    st.write(response)
-                    #st.snow()
-                elif isinstance(response, list):
-                    # Handle list responses, assuming they might be in tabular format
-                    if all(isinstance(i, tuple) for i in response) and len(response) > 0:
-                        # Assuming the first tuple contains the headers
-                        headers = [f"Column {i+1}" for i in range(len(response[0]))]
-                        df = pd.DataFrame(response, columns=headers)
-                        st.dataframe(df.style.set_properties(**{'color': 'white', 'background-color': 'black'}))
-                        #st.snow()
-                    else:
-                        st.write("The response is not in tabular format.")
-                else:
-                    st.write("Unexpected response format.")
-                
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")